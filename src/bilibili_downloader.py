@@ -4,6 +4,8 @@ import json
 import subprocess
 import os
 import re
+import shutil
+import tempfile
 from tqdm import tqdm
 import urllib.parse
 import threading
@@ -14,6 +16,19 @@ FFMPEG_PATH = "ffmpeg" # Default command
 # For GUI, the main_app.py will pass a full path from settings.
 DEFAULT_OUTPUT_BASE_PATH = "output" 
 
+# Settings shared by the GUI, the CLI and the daemon
+CONFIG_FILE = os.path.expanduser("~/.bilibili_downloader_config.json")
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r') as f:
+            return json.load(f)
+    return {}
+
+def save_config(config):
+    with open(CONFIG_FILE, 'w') as f:
+        json.dump(config, f)
+
 class BilibiliDownloader:
     @staticmethod
     def sanitize_folder_name(name):
@@ -30,13 +45,17 @@ class BilibiliDownloader:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://www.bilibili.com/'
         }
+        # One session per downloader so keep-alive connections are reused across requests/jobs
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.cookies.update(self.cookies)
 
     def get_video_info(self, bvid):
         if not self.cookies.get('SESSDATA') and not bvid.startswith('BV'):
             raise ValueError("Invalid BVid format. Example: BV1xx411c7mh")
             
         url = f'https://api.bilibili.com/x/web-interface/view?bvid={bvid}'
-        response = requests.get(url, headers=self.headers, cookies=self.cookies)
+        response = self.session.get(url)
         
         try:
             data = response.json()
@@ -85,11 +104,19 @@ class BilibiliDownloader:
         output_dir = os.path.join(base_download_dir, sanitized_title)
         os.makedirs(output_dir, exist_ok=True) # Ensure base_download_dir and output_dir are created
         
-        temp_dir = os.path.join(output_dir, 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
+        # Unique per download so concurrent downloads of same-titled videos never share temp files.
+        # Removed on every exit path (stop, HTTP error, ffmpeg error) so partial downloads never pile up.
+        temp_dir = tempfile.mkdtemp(prefix='temp_', dir=output_dir)
+        try:
+            self._download_to(bvid, video_info, quality, output_format, temp_dir, output_dir, sanitized_title,
+                              progress_callback, stop_event, ffmpeg_path)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
+    def _download_to(self, bvid, video_info, quality, output_format, temp_dir, output_dir, sanitized_title,
+                     progress_callback, stop_event, ffmpeg_path):
         play_url = f"https://api.bilibili.com/x/player/playurl?bvid={bvid}&cid={video_info['cid']}&qn={quality}&fnval=4048"
-        response = requests.get(play_url, headers=self.headers, cookies=self.cookies)
+        response = self.session.get(play_url)
         play_data = response.json()
 
         if 'dash' not in play_data['data']:
@@ -107,7 +134,6 @@ class BilibiliDownloader:
         video_file = self._download_file(video_url, video_file_temp, "Video", progress_callback, stop_event)
         if stop_event and stop_event.is_set():
             if progress_callback: progress_callback(0, 100, "Download stopped by user (video).")
-            self._cleanup_temp_files(temp_dir, video_file_temp, None)
             return
 
         if progress_callback:
@@ -115,7 +141,6 @@ class BilibiliDownloader:
         audio_file = self._download_file(audio_url, audio_file_temp, "Audio", progress_callback, stop_event)
         if stop_event and stop_event.is_set():
             if progress_callback: progress_callback(0, 100, "Download stopped by user (audio).")
-            self._cleanup_temp_files(temp_dir, video_file_temp, audio_file_temp)
             return
 
         # Determine video output format. Default to mp4 if format is mp3 or empty.
@@ -123,39 +148,40 @@ class BilibiliDownloader:
         if not video_output_ext or video_output_ext == 'mp3':
             video_output_ext = 'mp4' # Default to mp4 for video file
         
-        final_video_file = os.path.join(output_dir, f"{sanitized_title}.{video_output_ext}")
-        final_mp3_file = os.path.join(output_dir, f"{sanitized_title}.mp3")
+        # The BVID keeps two different videos with the same (sanitized) title from overwriting each other;
+        # re-downloading the same video replaces its own earlier output.
+        final_video_file = os.path.join(output_dir, f"{sanitized_title} [{bvid}].{video_output_ext}")
+        final_mp3_file = os.path.join(output_dir, f"{sanitized_title} [{bvid}].mp3")
+        # ffmpeg writes inside temp_dir and results are moved into place only once both succeed,
+        # so a stopped or failed run never leaves a partial file under the final name
+        merged_video_temp = os.path.join(temp_dir, f"merged.{video_output_ext}")
+        mp3_temp = os.path.join(temp_dir, 'audio.mp3')
         
         try:
             if progress_callback:
                 progress_callback(0, 100, f"Merging video and audio to {video_output_ext.upper()}...")
             
-            subprocess.run([
-                ffmpeg_path, '-i', video_file, '-i', audio_file,
+            self._run_ffmpeg([
+                ffmpeg_path, '-y', '-i', video_file, '-i', audio_file,
                 '-c:v', 'copy', '-c:a', 'copy',
-                final_video_file
-            ], check=True, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+                merged_video_temp
+            ], stop_event)
 
             if stop_event and stop_event.is_set():
                  if progress_callback: progress_callback(0, 100, "Download stopped by user (during video merge).")
-                 self._cleanup_temp_files(temp_dir, video_file, audio_file)
-                 if os.path.exists(final_video_file): os.remove(final_video_file)
                  return
 
             if progress_callback:
                 progress_callback(0, 100, "Converting audio to MP3...")
 
-            subprocess.run([
-                ffmpeg_path, '-i', audio_file, 
+            self._run_ffmpeg([
+                ffmpeg_path, '-y', '-i', audio_file, 
                 '-c:a', 'libmp3lame', '-q:a', '0', 
-                final_mp3_file
-            ], check=True, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+                mp3_temp
+            ], stop_event)
             
             if stop_event and stop_event.is_set():
                  if progress_callback: progress_callback(0, 100, "Download stopped by user (during MP3 conversion).")
-                 self._cleanup_temp_files(temp_dir, video_file, audio_file)
-                 if os.path.exists(final_video_file): os.remove(final_video_file)
-                 if os.path.exists(final_mp3_file): os.remove(final_mp3_file)
                  return
 
         except subprocess.CalledProcessError as e:
@@ -163,38 +189,41 @@ class BilibiliDownloader:
             if hasattr(e, 'cmd'): error_message += f"\nCommand: {' '.join(e.cmd)}"
             if progress_callback:
                 progress_callback(0, 100, error_message)
-            self._cleanup_temp_files(temp_dir, video_file, audio_file)
-            if os.path.exists(final_video_file): os.remove(final_video_file)
-            if os.path.exists(final_mp3_file): os.remove(final_mp3_file)
             raise Exception(error_message)
-        finally:
-            self._cleanup_temp_files(temp_dir, video_file, audio_file)
+
+        os.replace(merged_video_temp, final_video_file)
+        os.replace(mp3_temp, final_mp3_file)
 
         if progress_callback:
              progress_callback(100, 100, f"Download completed: {final_video_file} and {final_mp3_file}")
         else:
             print(f"Download completed: {final_video_file} and {final_mp3_file} (using {ffmpeg_path} in {output_dir})") # Added output_dir for CLI clarity
 
-    def _cleanup_temp_files(self, temp_dir, video_file_temp_path=None, audio_file_temp_path=None):
-        # video_file_temp_path and audio_file_temp_path are the paths in the temp_dir
-        if video_file_temp_path and os.path.exists(video_file_temp_path):
-            os.remove(video_file_temp_path)
-        if audio_file_temp_path and os.path.exists(audio_file_temp_path):
-            os.remove(audio_file_temp_path)
-        
-        # Attempt to remove temp_dir if it exists and is empty
-        if os.path.exists(temp_dir):
-            try:
-                if not os.listdir(temp_dir):
-                    os.rmdir(temp_dir)
-                # else: # Optionally log or handle if temp dir is not empty after cleanup
-                #    print(f"Warning: Temp directory {temp_dir} is not empty after cleanup.")
-            except OSError as e:
-                # print(f"Error removing temp directory {temp_dir}: {e}") # Optional logging
-                pass
+    def _run_ffmpeg(self, cmd, stop_event=None):
+        # Own session: a terminal Ctrl-C reaches only the caller, which decides how to stop.
+        # ffmpeg is terminated when stop_event is set, and killed if the caller exits any other way,
+        # so it never outlives the download it belongs to.
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, encoding='utf-8', errors='ignore', start_new_session=True)
+        try:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    if stop_event and stop_event.is_set():
+                        process.terminate()
+                        process.communicate()
+                        raise InterruptedError("FFmpeg stopped by user.")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd, output=stdout, stderr=stderr)
 
     def _download_file(self, url, filename, file_type_label="File", progress_callback=None, stop_event=None):
-        response = requests.get(url, headers=self.headers, cookies=self.cookies, stream=True)
+        response = self.session.get(url, stream=True)
         response.raise_for_status()
         total_size = int(response.headers.get('content-length', 0))
         downloaded_size = 0
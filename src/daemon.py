@@ -0,0 +1,414 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Import downloader class, bvid extraction and the settings shared with the GUI
+from src.bilibili_downloader import BilibiliDownloader, extract_bvid, load_config
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+QUEUE_FILE = os.path.expanduser("~/.bilibili_downloader_queue.json")
+# Finished jobs kept for listing; older ones are dropped so the queue file stays small
+KEEP_FINISHED = 200
+
+# Job states. Only 'queued' jobs are picked up by workers; finished jobs are kept for listing.
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+def validate_ffmpeg(ffmpeg_path):
+    # Run once at startup instead of discovering a broken ffmpeg at the end of every download
+    try:
+        result = subprocess.run([ffmpeg_path, '-version'], check=True, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise Exception(f"FFmpeg not usable at '{ffmpeg_path}': {e}")
+    return result.stdout.splitlines()[0] if result.stdout else ffmpeg_path
+
+
+class JobQueue:
+    """Download jobs persisted to a JSON file so a restarted daemon resumes where it stopped."""
+
+    def __init__(self, queue_file=QUEUE_FILE, keep_finished=KEEP_FINISHED):
+        self.queue_file = queue_file
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.stop_events = {}
+        self._cancel_requested = set()
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.queue_file):
+            return
+        with open(self.queue_file, 'r') as f:
+            jobs = json.load(f)
+        for job in jobs:
+            # A job that was running when the daemon went down has no finished output yet; run it again
+            if job['status'] == RUNNING:
+                job['status'] = QUEUED
+                job['message'] = "Requeued after daemon restart."
+                job['progress'] = 0
+            self.jobs[job['id']] = job
+            self._seq = max(self._seq, job['seq'])
+        self._prune()
+
+    def _save(self):
+        # Caller holds self._condition. Write-then-rename so a crash never leaves a truncated queue file.
+        temp_file = f"{self.queue_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(sorted(self.jobs.values(), key=lambda job: job['seq']), f, indent=2)
+        os.replace(temp_file, self.queue_file)
+
+    def submit(self, bvid, quality, output_format, download_path, priority=0):
+        # Returns (job, created). A BVID that is already pending is not queued twice:
+        # two workers downloading it at once would write to the same output files.
+        with self._condition:
+            for job in self.jobs.values():
+                if job['bvid'] == bvid and job['status'] in (QUEUED, RUNNING):
+                    return dict(job), False
+            self._seq += 1
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'seq': self._seq,
+                'bvid': bvid,
+                'quality': quality,
+                'format': output_format,
+                'download_path': download_path,
+                'priority': priority,
+                'status': QUEUED,
+                'progress': 0,
+                'message': "Queued.",
+                'created_at': time.time(),
+                'finished_at': None,
+            }
+            self.jobs[job['id']] = job
+            self._save()
+            self._condition.notify()
+            return dict(job), True
+
+    def list(self):
+        with self._condition:
+            return [dict(job) for job in sorted(self.jobs.values(), key=self._order)]
+
+    def get(self, job_id):
+        with self._condition:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def cancel(self, job_id):
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            if job['status'] == QUEUED:
+                self._finish(job, CANCELLED, "Cancelled before start.")
+            elif job['status'] == RUNNING:
+                # The worker notices the stop event, cleans up temp files and marks the job cancelled
+                self._cancel_requested.add(job_id)
+                self.stop_events[job_id].set()
+                job['message'] = "Stopping..."
+            return dict(job)
+
+    def set_priority(self, job_id, priority):
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            if job['status'] not in FINISHED_STATES:
+                job['priority'] = priority
+                self._save()
+            return dict(job)
+
+    def next_job(self, shutdown_event):
+        # Blocks until a queued job is available (highest priority first, then submission order)
+        with self._condition:
+            while not shutdown_event.is_set():
+                queued = [job for job in self.jobs.values() if job['status'] == QUEUED]
+                if queued:
+                    job = min(queued, key=self._order)
+                    job['status'] = RUNNING
+                    job['message'] = "Starting..."
+                    self.stop_events[job['id']] = threading.Event()
+                    self._save()
+                    return dict(job), self.stop_events[job['id']]
+                self._condition.wait(timeout=1)
+            return None, None
+
+    def update_progress(self, job_id, current_val, total_val, message):
+        # Progress is kept in memory only; persisting every chunk would cost more than the download
+        with self._condition:
+            job = self.jobs[job_id]
+            job['progress'] = int(current_val * 100 / total_val) if total_val else 0
+            job['message'] = message
+
+    def finish(self, job_id, status, message):
+        with self._condition:
+            self.stop_events.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
+            self._finish(self.jobs[job_id], status, message)
+
+    def _finish(self, job, status, message):
+        job['status'] = status
+        job['message'] = message
+        job['finished_at'] = time.time()
+        if status == COMPLETED:
+            job['progress'] = 100
+        self._prune()
+        self._save()
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job['status'] in FINISHED_STATES]
+        if len(finished) <= self.keep_finished:
+            return
+        finished.sort(key=lambda job: job['finished_at'] or 0)
+        for job in finished[:len(finished) - self.keep_finished]:
+            del self.jobs[job['id']]
+
+    def stopped(self, job_id, shutting_down):
+        # A stop caused by daemon shutdown is not a user cancel; leave the job for the next start
+        with self._condition:
+            self.stop_events.pop(job_id, None)
+            job = self.jobs[job_id]
+            if shutting_down and job_id not in self._cancel_requested:
+                job['status'] = QUEUED
+                job['progress'] = 0
+                job['message'] = "Requeued after daemon shutdown."
+                self._save()
+            else:
+                self._cancel_requested.discard(job_id)
+                self._finish(job, CANCELLED, "Download stopped by user.")
+
+    def stop_running(self):
+        with self._condition:
+            for stop_event in self.stop_events.values():
+                stop_event.set()
+            self._condition.notify_all()
+
+    @staticmethod
+    def _order(job):
+        return (-job['priority'], job['seq'])
+
+
+class DownloadWorker(threading.Thread):
+    """Runs queued jobs on one long-lived BilibiliDownloader so its connection pool stays warm."""
+
+    def __init__(self, job_queue, sessdata, ffmpeg_path, shutdown_event):
+        super().__init__(daemon=True)
+        self.job_queue = job_queue
+        # download_video also stores this in the module-level FFMPEG_PATH. Every worker passes the
+        # same startup-validated path, so concurrent writes to that global never change its value.
+        self.ffmpeg_path = ffmpeg_path
+        self.shutdown_event = shutdown_event
+        self.downloader = BilibiliDownloader(sessdata)
+
+    def run(self):
+        while not self.shutdown_event.is_set():
+            job, stop_event = self.job_queue.next_job(self.shutdown_event)
+            if job is None:
+                return
+            self.run_job(job, stop_event)
+
+    def run_job(self, job, stop_event):
+        job_id = job['id']
+        try:
+            self.downloader.download_video(
+                job['bvid'],
+                job['quality'],
+                job['format'],
+                progress_callback=lambda current_val, total_val, message: self.job_queue.update_progress(job_id, current_val, total_val, message),
+                stop_event=stop_event,
+                ffmpeg_path=self.ffmpeg_path,
+                custom_output_base_path=job['download_path']
+            )
+            if not stop_event.is_set():
+                self.job_queue.finish(job_id, COMPLETED, "Download completed successfully!")
+            else:
+                self.job_queue.stopped(job_id, self.shutdown_event.is_set())
+        except InterruptedError:
+            self.job_queue.stopped(job_id, self.shutdown_event.is_set())
+        except Exception as e:
+            # A stop or shutdown can surface as an unexpected error (e.g. a connection torn down mid-read);
+            # that is not a failed job
+            if stop_event.is_set() or self.shutdown_event.is_set():
+                self.job_queue.stopped(job_id, self.shutdown_event.is_set())
+                return
+            traceback.print_exc()
+            self.job_queue.finish(job_id, FAILED, f"Download failed: {str(e)}")
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """
+    Local JSON API:
+        GET  /jobs                  list jobs
+        GET  /jobs/<id>             show one job
+        POST /jobs                  submit {"url": ..., "quality"?, "format"?, "download_path"?, "priority"?}
+                                    (returns the existing job if that BVID is already queued or running,
+                                    or 409 if that job has a different quality/format/download_path)
+        POST /jobs/<id>/cancel      cancel a queued or running job
+        POST /jobs/<id>/priority    reprioritize a pending job {"priority": int}
+    """
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ['jobs']:
+            self._send_json(200, {'jobs': self.server.job_queue.list()})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            self._send_job(self.server.job_queue.get(parts[1]))
+        else:
+            self._send_json(404, {'error': "Not found"})
+
+    def do_POST(self):
+        parts = self._path_parts()
+        try:
+            body = self._read_json()
+            if parts == ['jobs']:
+                self._submit(body)
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+                self._send_job(self.server.job_queue.cancel(parts[1]))
+            elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'priority':
+                if 'priority' not in body:
+                    raise ValueError("Missing 'priority'")
+                self._send_job(self.server.job_queue.set_priority(parts[1], self._int_field(body, 'priority', 0)))
+            else:
+                self._send_json(404, {'error': "Not found"})
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+
+    def _submit(self, body):
+        video_url_or_bvid = self._str_field(body, 'url', None) or self._str_field(body, 'bvid', None)
+        if not video_url_or_bvid:
+            raise ValueError("Please provide a Bilibili video 'url' or 'bvid'.")
+        bvid = extract_bvid(video_url_or_bvid)
+
+        # Per-job fields fall back to the same settings the GUI saves
+        config = load_config()
+        download_path = self._str_field(body, 'download_path', None) or config.get('download_path')
+        settings = {
+            'quality': self._int_field(body, 'quality', config.get('quality', 80)),
+            'format': self._str_field(body, 'format', None) or config.get('format', 'mp4'),
+            'download_path': os.path.expanduser(download_path) if download_path else None,
+        }
+        job, created = self.server.job_queue.submit(
+            bvid,
+            settings['quality'],
+            settings['format'],
+            settings['download_path'],
+            self._int_field(body, 'priority', 0)
+        )
+        if created:
+            self._send_json(201, job)
+        elif all(job[key] == value for key, value in settings.items()):
+            self._send_json(200, job)
+        else:
+            # Tell the client its settings were not applied rather than silently returning the old job
+            self._send_json(409, {'error': f"{bvid} is already {job['status']} with different settings", 'job': job})
+
+    @staticmethod
+    def _int_field(body, name, default):
+        value = body.get(name, default)
+        # bool is an int subclass, but "priority": true is a client bug rather than priority 1
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f"'{name}' must be an integer")
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"'{name}' must be an integer")
+
+    @staticmethod
+    def _str_field(body, name, default):
+        value = body.get(name, default)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"'{name}' must be a string")
+        return value
+
+    def _path_parts(self):
+        return [part for part in self.path.split('?', 1)[0].split('/') if part]
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError:
+            raise ValueError("Request body must be JSON")
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object")
+        return body
+
+    def _send_job(self, job):
+        if job is None:
+            self._send_json(404, {'error': "Job not found"})
+        else:
+            self._send_json(200, job)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bilibili Video Downloader daemon (local JSON job API)')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'Address to listen on (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--queue_file', default=QUEUE_FILE, help=f'Where the job queue is persisted (default: {QUEUE_FILE})')
+    parser.add_argument('--workers', type=int, default=1, help='Number of concurrent downloads (default: 1)')
+    parser.add_argument('--keep_finished', type=int, default=KEEP_FINISHED, help=f'Finished jobs to keep in the queue file (default: {KEEP_FINISHED})')
+    args = parser.parse_args()
+
+    config = load_config()
+    ffmpeg_path = config.get("ffmpeg_path", "ffmpeg")
+    try:
+        print(f"Using {validate_ffmpeg(ffmpeg_path)}")
+    except Exception as e:
+        sys.exit(str(e))
+    if not config.get("SESSDATA"):
+        print("Warning: SESSDATA is not configured; HD formats and login-required videos will fail.")
+
+    job_queue = JobQueue(os.path.expanduser(args.queue_file), max(0, args.keep_finished))
+    shutdown_event = threading.Event()
+    workers = [DownloadWorker(job_queue, config.get("SESSDATA"), ffmpeg_path, shutdown_event) for _ in range(max(1, args.workers))]
+    for worker in workers:
+        worker.start()
+
+    server = ThreadingHTTPServer((args.host, args.port), DaemonRequestHandler)
+    server.job_queue = job_queue
+    print(f"Listening on http://{args.host}:{args.port} (queue: {job_queue.queue_file})")
+    # systemd, docker and kill send SIGTERM; shut down the same way as on Ctrl-C
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # Interrupted downloads go back to 'queued' and are restarted on the next launch
+        shutdown_event.set()
+        job_queue.stop_running()
+        for worker in workers:
+            worker.join(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,28 +4,16 @@ from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QLineEdit, QPushButto
 from PyQt5.QtCore import QThread, pyqtSignal, QStandardPaths, Qt
 from PyQt5.QtGui import QIcon
 import os
-import json
 import traceback
 import threading
 import charset_normalizer # Dummy import to help py2app
 
 # Import downloader class and bvid extraction
-from src.bilibili_downloader import BilibiliDownloader, extract_bvid
+from src.bilibili_downloader import BilibiliDownloader, extract_bvid, load_config, save_config
 
 
-CONFIG_FILE = os.path.expanduser("~/.bilibili_downloader_config.json")
 DEFAULT_DOWNLOAD_PATH = QStandardPaths.writableLocation(QStandardPaths.DownloadLocation)
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_config(config):
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f)
-
 class DownloadThread(QThread):
     progress_update_signal = pyqtSignal(int, int, str)
     finished_signal = pyqtSignal(str)
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src.bilibili_downloader import BilibiliDownloader
+
+
+VIDEO_INFO = {'title': 'Some Video', 'pages': [], 'cid': 1, 'quality': [80]}
+PLAY_DATA = {'data': {'dash': {
+    'video': [{'base_url': 'https://example.invalid/video.m4s'}],
+    'audio': [{'base_url': 'https://example.invalid/audio.m4s'}],
+}}}
+
+
+class FakeResponse:
+    def __init__(self, json_data=None, chunks=(), on_chunk=None):
+        self.json_data = json_data
+        self.chunks = chunks
+        self.on_chunk = on_chunk
+        self.headers = {'content-length': str(sum(len(chunk) for chunk in chunks))}
+
+    def json(self):
+        return self.json_data
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            yield chunk
+            if self.on_chunk:
+                self.on_chunk()
+
+
+class FakeSession:
+    def __init__(self, stream_response):
+        self.stream_response = stream_response
+
+    def get(self, url, stream=False):
+        return self.stream_response if stream else FakeResponse(json_data=PLAY_DATA)
+
+
+@pytest.fixture
+def downloader(monkeypatch):
+    downloader = BilibiliDownloader()
+    monkeypatch.setattr(downloader, 'get_video_info', lambda bvid: VIDEO_INFO)
+    return downloader
+
+
+def test_stopped_download_leaves_no_temp_dir(downloader, tmp_path):
+    stop_event = threading.Event()
+    # The user stops the download after the first chunk of the video stream
+    downloader.session = FakeSession(FakeResponse(chunks=[b'a' * 10, b'b' * 10], on_chunk=stop_event.set))
+
+    with pytest.raises(InterruptedError):
+        downloader.download_video('BV1xx411c7mh', progress_callback=lambda *args: None,
+                                  stop_event=stop_event, custom_output_base_path=str(tmp_path))
+
+    output_dir = tmp_path / 'Bilibili_Downloads' / 'Some Video'
+    assert os.listdir(output_dir) == []
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    # Stands in for ffmpeg: writes the input paths to the output file (its last argument)
+    path = tmp_path / 'ffmpeg'
+    path.write_text('#!/bin/sh\nfor last; do :; done\necho "$@" > "$last"\n')
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_same_titled_videos_keep_separate_outputs(downloader, tmp_path, fake_ffmpeg):
+    downloader.session = FakeSession(FakeResponse(chunks=[b'a' * 10]))
+    for bvid in ('BV1xx411c7m1', 'BV1xx411c7m2'):
+        downloader.download_video(bvid, progress_callback=lambda *args: None,
+                                  ffmpeg_path=fake_ffmpeg, custom_output_base_path=str(tmp_path / 'out'))
+
+    output_dir = tmp_path / 'out' / 'Bilibili_Downloads' / 'Some Video'
+    assert sorted(os.listdir(output_dir)) == [
+        'Some Video [BV1xx411c7m1].mp3', 'Some Video [BV1xx411c7m1].mp4',
+        'Some Video [BV1xx411c7m2].mp3', 'Some Video [BV1xx411c7m2].mp4',
+    ]
+
+
+def test_stop_during_ffmpeg_terminates_it(downloader, tmp_path):
+    pid_file = tmp_path / 'ffmpeg.pid'
+    slow_ffmpeg = tmp_path / 'slow_ffmpeg'
+    slow_ffmpeg.write_text(f'#!/bin/sh\necho $$ > "{pid_file}"\nexec sleep 30\n')
+    slow_ffmpeg.chmod(0o755)
+    downloader.session = FakeSession(FakeResponse(chunks=[b'a' * 10]))
+    stop_event = threading.Event()
+    threading.Timer(0.5, stop_event.set).start()
+
+    start = time.monotonic()
+    with pytest.raises(InterruptedError):
+        downloader.download_video('BV1xx411c7mh', progress_callback=lambda *args: None, stop_event=stop_event,
+                                  ffmpeg_path=str(slow_ffmpeg), custom_output_base_path=str(tmp_path / 'out'))
+
+    assert time.monotonic() - start < 10
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+    assert os.listdir(tmp_path / 'out' / 'Bilibili_Downloads' / 'Some Video') == []
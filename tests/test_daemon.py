@@ -0,0 +1,188 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from src import daemon
+from src.daemon import JobQueue, DownloadWorker, DaemonRequestHandler
+
+
+@pytest.fixture
+def queue_file(tmp_path):
+    return str(tmp_path / "queue.json")
+
+
+@pytest.fixture
+def job_queue(queue_file):
+    return JobQueue(queue_file)
+
+
+def submit(job_queue, bvid, priority=0):
+    job, _ = job_queue.submit(bvid, 80, 'mp4', None, priority)
+    return job
+
+
+def test_next_job_runs_highest_priority_then_submission_order(job_queue):
+    first = submit(job_queue, 'BV1xx411c7m1')
+    second = submit(job_queue, 'BV1xx411c7m2')
+    urgent = submit(job_queue, 'BV1xx411c7m3', priority=5)
+    shutdown_event = threading.Event()
+
+    order = [job_queue.next_job(shutdown_event)[0]['id'] for _ in range(3)]
+
+    assert order == [urgent['id'], first['id'], second['id']]
+
+
+def test_submit_returns_existing_job_for_pending_bvid(job_queue):
+    job, created = job_queue.submit('BV1xx411c7m1', 80, 'mp4', None)
+    again, created_again = job_queue.submit('BV1xx411c7m1', 80, 'mp4', None)
+
+    assert created and not created_again
+    assert again['id'] == job['id']
+
+
+def test_cancel_queued_job_finishes_it(job_queue):
+    job = submit(job_queue, 'BV1xx411c7m1')
+
+    assert job_queue.cancel(job['id'])['status'] == daemon.CANCELLED
+
+
+def test_cancel_running_job_signals_worker(job_queue):
+    submit(job_queue, 'BV1xx411c7m1')
+    job, stop_event = job_queue.next_job(threading.Event())
+
+    assert job_queue.cancel(job['id'])['status'] == daemon.RUNNING
+    assert stop_event.is_set()
+    # Even if shutdown happens before the worker reacts, a user cancel stays a cancel
+    job_queue.stopped(job['id'], shutting_down=True)
+    assert job_queue.get(job['id'])['status'] == daemon.CANCELLED
+
+
+def test_set_priority_ignored_on_finished_job(job_queue):
+    job = submit(job_queue, 'BV1xx411c7m1')
+    job_queue.cancel(job['id'])
+
+    assert job_queue.set_priority(job['id'], 10)['priority'] == 0
+
+
+def test_load_requeues_running_jobs(queue_file, job_queue):
+    submit(job_queue, 'BV1xx411c7m1')
+    job, _ = job_queue.next_job(threading.Event())
+
+    reloaded = JobQueue(queue_file).get(job['id'])
+
+    assert reloaded['status'] == daemon.QUEUED
+    assert reloaded['progress'] == 0
+
+
+def test_stopped_during_shutdown_requeues(queue_file, job_queue):
+    submit(job_queue, 'BV1xx411c7m1')
+    job, _ = job_queue.next_job(threading.Event())
+
+    job_queue.stopped(job['id'], shutting_down=True)
+
+    assert job_queue.get(job['id'])['status'] == daemon.QUEUED
+    assert JobQueue(queue_file).get(job['id'])['status'] == daemon.QUEUED
+
+
+def test_finished_jobs_are_pruned(queue_file):
+    job_queue = JobQueue(queue_file, keep_finished=2)
+    jobs = [submit(job_queue, f'BV1xx411c7m{i}') for i in range(4)]
+    for job in jobs:
+        job_queue.cancel(job['id'])
+
+    assert [job['id'] for job in job_queue.list()] == [job['id'] for job in jobs[2:]]
+
+
+def test_worker_requeues_job_failing_during_shutdown(job_queue, monkeypatch):
+    shutdown_event = threading.Event()
+
+    def download_video(self, *args, **kwargs):
+        # e.g. a connection torn down while the daemon shuts down
+        shutdown_event.set()
+        raise Exception("FFmpeg error during processing")
+
+    monkeypatch.setattr(daemon.BilibiliDownloader, 'download_video', download_video)
+    submit(job_queue, 'BV1xx411c7m1')
+    job, stop_event = job_queue.next_job(shutdown_event)
+
+    DownloadWorker(job_queue, None, 'ffmpeg', shutdown_event).run_job(job, stop_event)
+
+    assert job_queue.get(job['id'])['status'] == daemon.QUEUED
+
+
+@pytest.fixture
+def api(job_queue, monkeypatch):
+    # No workers are started, so nothing is downloaded; submitted jobs just stay queued
+    monkeypatch.setattr(daemon, 'load_config', lambda: {})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DaemonRequestHandler)
+    server.job_queue = job_queue
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def call(path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(base_url + path, data=data, method='POST' if data is not None else 'GET')
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    yield call
+    server.shutdown()
+    server.server_close()
+
+
+def test_api_submit_and_list(api):
+    status, job = api('/jobs', {'url': 'https://www.bilibili.com/video/BV1xx411c7mh', 'priority': 2})
+
+    assert status == 201
+    assert job['bvid'] == 'BV1xx411c7mh'
+    assert job['format'] == 'mp4'
+    assert api('/jobs') == (200, {'jobs': [job]})
+    assert api(f"/jobs/{job['id']}/priority", {'priority': '7'})[1]['priority'] == 7
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {'url': 'not a bilibili url'},
+    {'url': 123},
+    {'url': 'BV1xx411c7mh', 'priority': None},
+    {'url': 'BV1xx411c7mh', 'priority': 'high'},
+    {'url': 'BV1xx411c7mh', 'quality': [80]},
+    {'url': 'BV1xx411c7mh', 'format': 4},
+    {'url': 'BV1xx411c7mh', 'download_path': False},
+])
+def test_api_rejects_bad_submit(api, body):
+    status, payload = api('/jobs', body)
+
+    assert status == 400
+    assert 'error' in payload
+
+
+def test_api_rejects_bad_priority(api):
+    _, job = api('/jobs', {'bvid': 'BV1xx411c7mh'})
+
+    assert api(f"/jobs/{job['id']}/priority", {'priority': [1]})[0] == 400
+    assert api(f"/jobs/{job['id']}/priority", {})[0] == 400
+
+
+def test_api_unknown_job_and_route(api):
+    assert api('/jobs/missing')[0] == 404
+    assert api('/jobs/missing/cancel', {})[0] == 404
+    assert api('/nope')[0] == 404
+
+
+def test_api_duplicate_submit(api):
+    _, job = api('/jobs', {'bvid': 'BV1xx411c7mh', 'format': 'mkv'})
+
+    assert api('/jobs', {'bvid': 'BV1xx411c7mh', 'format': 'mkv'}) == (200, job)
+    status, payload = api('/jobs', {'bvid': 'BV1xx411c7mh', 'format': 'mp4'})
+    assert status == 409
+    assert payload['job'] == job
+    assert api('/jobs', {'bvid': 'BV1xx411c7mh', 'format': 'mkv', 'quality': 116})[0] == 409